@@ -1,16 +1,33 @@
 import os
 from typing import Literal
 
-import requests
 from dotenv import load_dotenv
 from pydantic import BaseModel
 from pydantic_ai import Agent
 
+from http_client import close_session, get_session
+
+try:
+    import uvloop
+except ImportError:  # uvloop has no Windows build
+    uvloop = None
+
 load_dotenv()
 
 if not os.getenv("GEMINI_API_KEY"):
     raise ValueError("❌ Missing GEMINI_API_KEY in .env file")
 
+_TRELLO_KEY = os.getenv("TRELLO_API_KEY")
+_TRELLO_TOKEN = os.getenv("TRELLO_TOKEN")
+_TRELLO_LIST_ID = os.getenv("TRELLO_LIST_ID")
+
+if not all([_TRELLO_KEY, _TRELLO_TOKEN, _TRELLO_LIST_ID]):
+    raise ValueError(
+        "❌ Missing TRELLO_API_KEY, TRELLO_TOKEN or TRELLO_LIST_ID in .env file"
+    )
+
+_BASE_PARAMS = {"key": _TRELLO_KEY, "token": _TRELLO_TOKEN}
+
 
 class TrelloCard(BaseModel):
     title: str
@@ -18,6 +35,9 @@ class TrelloCard(BaseModel):
     tag: Literal["Bug", "Feature", "Docs"]
 
 
+_TAG_PREFIX = {"Bug": "[Bug] ", "Feature": "[Feature] ", "Docs": "[Docs] "}
+
+
 agent = Agent(
     "google-gla:gemini-2.5-flash-lite",
     output_type=TrelloCard,
@@ -26,23 +46,22 @@ agent = Agent(
 )
 
 
-def post_to_trello(card: TrelloCard):
+async def post_to_trello(card: TrelloCard):
     url = "https://api.trello.com/1/cards"
     query = {
-        "key": os.getenv("TRELLO_API_KEY"),
-        "token": os.getenv("TRELLO_TOKEN"),
-        "idList": os.getenv("TRELLO_LIST_ID"),
-        "name": f"[{card.tag}] {card.title}",
+        **_BASE_PARAMS,
+        "idList": _TRELLO_LIST_ID,
+        "name": _TAG_PREFIX[card.tag] + card.title,
         "desc": card.description,
         "pos": "top",
     }
 
-    response = requests.post(url, params=query)
-
-    if response.status_code == 200:
-        print("Trello card created successfully")
-    else:
-        print(f"Failed to create Trello card: {response.text}")
+    session = await get_session()
+    async with session.post(url, params=query) as response:
+        if response.status == 200:
+            print("Trello card created successfully")
+        else:
+            print(f"Failed to create Trello card: {await response.text()}")
 
 
 USER_DB = ["alice", "bob", "charlie"]
@@ -58,10 +77,13 @@ async def main():
 
     # Phase 2: Execute (Real World)
     print(f"✅ Generated Plan: {card_data.title}")
-    post_to_trello(card_data)
+    try:
+        await post_to_trello(card_data)
+    finally:
+        await close_session()
 
 
 if __name__ == "__main__":
     import asyncio
 
-    asyncio.run(main())
+    asyncio.run(main(), loop_factory=uvloop.new_event_loop if uvloop else None)
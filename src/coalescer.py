@@ -0,0 +1,115 @@
+import asyncio
+import math
+from collections import deque
+from typing import Any, Awaitable, Callable, List, Optional
+
+from google import genai
+
+EMBED_MODEL = "text-embedding-004"
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class BatchCoalescer:
+    """Merges similar queries submitted within a short window into one workflow run.
+
+    Queries are embedded in a single batched call and greedily clustered by
+    cosine similarity; each cluster runs the workflow once with the combined
+    reports, and every submitter of that cluster receives its result.
+    """
+
+    def __init__(
+        self,
+        workflow: Callable[[str], Awaitable[Any]],
+        window: float = 0.5,
+        threshold: float = 0.88,
+    ):
+        self._workflow = workflow
+        self.window = window
+        self.threshold = threshold
+        self._client = genai.Client()
+        self._queue: deque = deque()
+        self._flush_task: Optional[asyncio.Task] = None
+        self.submitted = 0
+        self.workflows_run = 0
+
+    @property
+    def batch_merge_rate(self) -> float:
+        """Share of submitted queries that were absorbed into another query's run."""
+        if not self.submitted:
+            return 0.0
+        return 1 - self.workflows_run / self.submitted
+
+    async def submit(self, query: str):
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((query, future))
+        self.submitted += 1
+
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_after_window())
+        return await future
+
+    async def _flush_after_window(self):
+        await asyncio.sleep(self.window)
+        batch = list(self._queue)
+        self._queue.clear()
+        self._flush_task = None
+
+        # Any failure here would otherwise strand every submitter's future
+        try:
+            clusters = await self._cluster([query for query, _ in batch])
+        except Exception as e:
+            print(f"Clustering failed, running queries separately: {e}")
+            clusters = [[i] for i in range(len(batch))]
+
+        await asyncio.gather(
+            *(self._run_cluster([batch[i] for i in cluster]) for cluster in clusters)
+        )
+
+    async def _cluster(self, queries: List[str]) -> List[List[int]]:
+        if len(queries) == 1:
+            return [[0]]
+
+        response = await self._client.aio.models.embed_content(
+            model=EMBED_MODEL, contents=queries
+        )
+
+        embeddings = response.embeddings or []
+        if len(embeddings) != len(queries):
+            raise ValueError(
+                f"Expected {len(queries)} embeddings, got {len(embeddings)}"
+            )
+
+        clusters = []  # (leader vector, member indices)
+        for i, embedding in enumerate(embeddings):
+            vector = _normalize(embedding.values)
+            for leader, members in clusters:
+                if sum(a * b for a, b in zip(leader, vector)) > self.threshold:
+                    members.append(i)
+                    break
+            else:
+                clusters.append((vector, [i]))
+
+        return [members for _, members in clusters]
+
+    async def _run_cluster(self, items):
+        queries = [query for query, _ in items]
+        if len(queries) == 1:
+            merged_query = queries[0]
+        else:
+            merged_query = "Combined reports: " + "; ".join(queries)
+
+        self.workflows_run += 1
+        try:
+            result = await self._workflow(merged_query)
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for _, future in items:
+                if not future.done():
+                    future.set_result(result)
@@ -0,0 +1,57 @@
+import asyncio
+from typing import Optional, Tuple
+
+import aiohttp
+
+RETRY_ATTEMPTS = 3
+RETRY_BACKOFF = 0.3  # seconds, doubled after each attempt
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+_session: Optional[aiohttp.ClientSession] = None
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+async def get_session() -> aiohttp.ClientSession:
+    """Returns the shared aiohttp session, creating it on first use.
+
+    A session is bound to the loop it was created on, so a new one is made
+    when called from a different loop (e.g. a second asyncio.run()).
+    """
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        _session_loop = loop
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=32, limit_per_host=16, ttl_dns_cache=300, keepalive_timeout=75
+            ),
+            timeout=aiohttp.ClientTimeout(total=10),
+        )
+    return _session
+
+
+async def close_session() -> None:
+    global _session, _session_loop
+    if _session is not None and _session_loop is asyncio.get_running_loop():
+        await _session.close()
+    _session = None
+    _session_loop = None
+
+
+async def get_with_retry(url: str, params: Optional[dict] = None) -> Tuple[int, bytes]:
+    """GETs a URL on the shared session, retrying rate limits and gateway errors.
+
+    Only for idempotent reads. Returns the final status and raw body.
+    """
+    session = await get_session()
+    for attempt in range(RETRY_ATTEMPTS + 1):
+        last_attempt = attempt == RETRY_ATTEMPTS
+        try:
+            async with session.get(url, params=params) as resp:
+                body = await resp.read()
+            if resp.status not in RETRY_STATUSES or last_attempt:
+                return resp.status, body
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if last_attempt:
+                raise
+        await asyncio.sleep(RETRY_BACKOFF * 2**attempt)
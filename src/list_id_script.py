@@ -1,8 +1,15 @@
+import asyncio
 import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
 
-import requests
+import orjson
 from dotenv import load_dotenv
 
+from http_client import close_session, get_with_retry
+
 load_dotenv()
 
 KEY = os.getenv("TRELLO_API_KEY")
@@ -12,29 +19,141 @@ if not KEY or not TOKEN:
     print("❌ Error: Missing Trello credentials in .env")
     exit()
 
-# 1. Get your username
-me_url = f"https://api.trello.com/1/members/me?key={KEY}&token={TOKEN}"
-user_id = requests.get(me_url).json()["id"]
+CACHE_PATH = Path.home() / ".trello_cache.json"
+CACHE_TTL = 24 * 60 * 60  # 24 hours
+CACHE_VERSION = 2
+
+# {board_id: {"name": board_name, "lists": {list_name: list_id}}}
+# Keyed by ID because Trello allows several boards with the same name.
+BoardLists = Dict[str, Dict[str, Any]]
+
+
+async def get_json(url: str):
+    status, body = await get_with_retry(url)
+    if status != 200:
+        # Strip the query string so the key/token never end up in the error
+        endpoint = url.split("?", 1)[0]
+        raise RuntimeError(
+            f"❌ Trello returned {status} for {endpoint}: {body.decode()[:200]}"
+        )
+    return orjson.loads(body)
+
+
+async def fetch_board_lists() -> BoardLists:
+    # /members/me/boards skips the separate lookup of your member ID
+    boards_url = f"https://api.trello.com/1/members/me/boards?key={KEY}&token={TOKEN}"
+    boards = await get_json(boards_url)
+
+    # Lists for every board are fetched concurrently
+    lists_per_board = await asyncio.gather(
+        *(
+            get_json(
+                f"https://api.trello.com/1/boards/{b['id']}/lists"
+                f"?key={KEY}&token={TOKEN}"
+            )
+            for b in boards
+        )
+    )
+
+    return {
+        b["id"]: {"name": b["name"], "lists": {l["name"]: l["id"] for l in lists}}
+        for b, lists in zip(boards, lists_per_board)
+    }
+
+
+def load_cache() -> Optional[BoardLists]:
+    try:
+        data = orjson.loads(CACHE_PATH.read_bytes())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+
+    if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+        return None
+    fetched_at = data.get("fetched_at")
+    if not isinstance(fetched_at, (int, float)) or time.time() - fetched_at > CACHE_TTL:
+        return None
+
+    boards = data.get("boards")
+    if not isinstance(boards, dict):
+        return None
+    for info in boards.values():
+        if not isinstance(info, dict) or not isinstance(info.get("lists"), dict):
+            return None
+    return boards
+
+
+def save_cache(boards: BoardLists):
+    CACHE_PATH.write_bytes(
+        orjson.dumps(
+            {"version": CACHE_VERSION, "fetched_at": time.time(), "boards": boards}
+        )
+    )
+
+
+async def get_board_lists(refresh: bool = False) -> BoardLists:
+    boards = None if refresh else load_cache()
+    if boards is None:
+        boards = await fetch_board_lists()
+        save_cache(boards)
+    return boards
+
+
+def _find_list_ids(boards: BoardLists, board: str, list_name: str) -> List[str]:
+    return [
+        info["lists"][list_name]
+        for board_id, info in boards.items()
+        if board in (board_id, info["name"]) and list_name in info["lists"]
+    ]
+
+
+async def resolve_list_id(board: str, list_name: str) -> Optional[str]:
+    """Looks up a list ID by board (name or ID) and list name.
+
+    Refetches once if the cache doesn't have it. Raises ValueError when several
+    boards share the name and each has such a list; pass the board ID instead.
+    """
+    boards = load_cache()
+    matches = _find_list_ids(boards, board, list_name) if boards else []
+    if not matches:
+        boards = await get_board_lists(refresh=True)
+        matches = _find_list_ids(boards, board, list_name)
+
+    if len(matches) > 1:
+        raise ValueError(
+            f"❌ Several boards named '{board}' have a list '{list_name}'. "
+            "Pass the board ID instead."
+        )
+    return matches[0] if matches else None
+
+
+async def scan_boards():
+    boards = await get_board_lists()
+    board_ids = list(boards)
+
+    print("\n📊 YOUR BOARDS:")
+    for idx, board_id in enumerate(board_ids):
+        print(f"{idx}: {boards[board_id]['name']} (ID: {board_id})")
+
+    board_idx = int(input("\nSelect a board number to scan: "))
+    board = boards[board_ids[board_idx]]
 
-# 2. Get your boards
-boards_url = (
-    f"https://api.trello.com/1/members/{user_id}/boards?key={KEY}&token={TOKEN}"
-)
-boards = requests.get(boards_url).json()
+    print(f"\n📝 LISTS ON '{board['name']}':")
+    for name, list_id in board["lists"].items():
+        print(f"Name: {name} | ID: {list_id}")
 
-print("\n📊 YOUR BOARDS:")
-for idx, b in enumerate(boards):
-    print(f"{idx}: {b['name']} (ID: {b['id']})")
+    print("\n✅ COPY the 'ID' above into your .env file as TRELLO_LIST_ID")
 
-board_idx = int(input("\nSelect a board number to scan: "))
-board_id = boards[board_idx]["id"]
 
-# 3. Get Lists on that board
-lists_url = f"https://api.trello.com/1/boards/{board_id}/lists?key={KEY}&token={TOKEN}"
-lists = requests.get(lists_url).json()
+async def main():
+    try:
+        if len(sys.argv) == 3:
+            # Usage: python list_id_script.py "<board name or ID>" "<list name>"
+            print(await resolve_list_id(sys.argv[1], sys.argv[2]))
+        else:
+            await scan_boards()
+    finally:
+        await close_session()
 
-print(f"\n📝 LISTS ON '{boards[board_idx]['name']}':")
-for l in lists:
-    print(f"Name: {l['name']} | ID: {l['id']}")
 
-print("\n✅ COPY the 'ID' above into your .env file as TRELLO_LIST_ID")
+if __name__ == "__main__":
+    asyncio.run(main())
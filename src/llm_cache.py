@@ -0,0 +1,42 @@
+import asyncio
+import hashlib
+from typing import Optional
+
+import diskcache
+import orjson
+
+DEFAULT_TTL = 60 * 60  # 1 hour
+
+
+class LLMCache:
+    """Disk-backed cache of agent outputs, keyed on model + system prompt + input.
+
+    The directory is only created on first use, so importing a module that
+    holds a cache doesn't touch the working directory.
+    """
+
+    def __init__(self, directory: str = ".llm_cache", ttl: int = DEFAULT_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        self._cache: Optional[diskcache.Cache] = None
+
+    @property
+    def cache(self) -> diskcache.Cache:
+        if self._cache is None:
+            self._cache = diskcache.Cache(self.directory)
+        return self._cache
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, prompt: str) -> str:
+        # Collapse whitespace so re-indented prompts still hit the same entry
+        payload = orjson.dumps(
+            {"model": model, "sys": system_prompt, "user": " ".join(prompt.split())},
+            option=orjson.OPT_SORT_KEYS,
+        )
+        return hashlib.sha256(payload).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self.cache.get, key)
+
+    async def set(self, key: str, value: str) -> None:
+        await asyncio.to_thread(self.cache.set, key, value, expire=self.ttl)
@@ -1,15 +1,49 @@
 import asyncio
-import json
 import os
-from typing import List, Literal, Optional
-
-import requests
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from string import Template
+from typing import List, Literal, Optional, Tuple, get_args
+
+import aiohttp
+import orjson
 from dotenv import load_dotenv
-from pydantic import BaseModel, Field
+from pydantic import BaseModel
 from pydantic_ai import Agent
+from pydantic_ai.models.openai import OpenAIChatModel
+from pydantic_ai.providers.ollama import OllamaProvider
+
+from http_client import close_session, get_session, get_with_retry
+from llm_cache import LLMCache
+
+try:
+    import uvloop
+except ImportError:  # uvloop has no Windows build
+    uvloop = None
 
 load_dotenv()
 
+_TRELLO_KEY = os.getenv("TRELLO_API_KEY")
+_TRELLO_TOKEN = os.getenv("TRELLO_TOKEN")
+_TRELLO_LIST_ID = os.getenv("TRELLO_LIST_ID")
+_TRELLO_BOARD_ID = os.getenv("TRELLO_BOARD_ID")
+
+if not all([_TRELLO_KEY, _TRELLO_TOKEN, _TRELLO_LIST_ID, _TRELLO_BOARD_ID]):
+    raise ValueError(
+        "❌ Missing TRELLO_API_KEY, TRELLO_TOKEN, TRELLO_LIST_ID or TRELLO_BOARD_ID "
+        "in .env file"
+    )
+
+_BASE_PARAMS = {"key": _TRELLO_KEY, "token": _TRELLO_TOKEN}
+
+# The executor only fills in a fixed schema, so a small quantized local model
+# is enough and saves a Gemini round trip on every retry.
+EXECUTOR_MODEL = os.getenv("EXECUTOR_MODEL", "ollama:llama3.2:3b-instruct-q4_K_M")
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1")
+
+_LLM_CACHE = LLMCache()
+
 
 class TrelloCard(BaseModel):
     id: Optional[str] = None
@@ -18,52 +52,95 @@ class TrelloCard(BaseModel):
     tag: Literal["Bug", "Feature", "Docs"]
 
 
+_TAG_PREFIX = {"Bug": "[Bug] ", "Feature": "[Feature] ", "Docs": "[Docs] "}
+
+
 class Plan(BaseModel):
     steps: List[str]
     reasoning: str
 
 
-class ExecutionResult(BaseModel):
-    output_data: Optional[TrelloCard] = None
+@dataclass(slots=True)
+class ExecutionResult:
     success: bool
+    output_data: Optional[TrelloCard] = None
     error_message: Optional[str] = None
 
 
-class Evaluation(BaseModel):
+@dataclass(slots=True)
+class Evaluation:
     decision: Literal["approve", "reject"]
     critique: Optional[str] = None
 
 
-class AgentState(BaseModel):
+Step = Literal["planning", "executing", "evaluating", "committing", "done", "failed"]
+
+
+@dataclass(slots=True)
+class AgentState:
+    """Mutable workflow state.
+
+    A slotted dataclass rather than a BaseModel: it is assigned to on every
+    step, so only the constructor arguments are validated.
+    """
+
     input_query: str
-    current_step: Literal[
-        "planning", "executing", "evaluating", "committing", "done", "failed"
-    ] = "planning"
-    scratchpad: List[str] = Field(default_factory=list)
+    current_step: Step = "planning"
+    scratchpad: List[str] = field(default_factory=list)
     draft_card: Optional[TrelloCard] = None
+    search_context: Optional[str] = None
     retry_count: int = 0
     max_retries: int = 3
     final_result: Optional[str] = None
 
+    def __post_init__(self):
+        if not isinstance(self.input_query, str):
+            raise ValueError("input_query must be a string")
+        if self.current_step not in get_args(Step):
+            raise ValueError(f"Unknown step: {self.current_step}")
+
+
+_STOPWORDS = frozenset(
+    "a an the to on in of for and or is it "
+    "fix update add create make please bug issue".split()
+)
+
+
+def _words(query: str) -> List[str]:
+    words = (w.strip(".,!?:;\"'").lower() for w in query.split())
+    return [w for w in words if w]
+
+
+def extract_keywords(query: str) -> str:
+    """Reduces a request to search keywords, e.g. 'Update the login bug.' -> 'login'."""
+    keywords = [w for w in _words(query) if w not in _STOPWORDS]
+    return " ".join(keywords) or query
+
 
-def search_trello_tool(query: str) -> str:
+_SEARCH_ERROR = "Error searching Trello: "
+
+
+async def search_trello_tool(query: str) -> str:
     """Searches Trello for card on configured board."""
     print(f"   >>> [Tool Call] Searching Trello for: '{query}'...")
 
     url = "https://api.trello.com/1/search"
     params = {
-        "key": os.getenv("TRELLO_API_KEY"),
-        "token": os.getenv("TRELLO_API_TOKEN"),
+        **_BASE_PARAMS,
         "query": query,
-        "idBoards": os.getenv("TRELLO_BOARD_ID"),
+        "idBoards": _TRELLO_BOARD_ID,
         "modelTypes": "cards",
         "card_fields": "name,desc,idList",
         "card_limit": 5,
     }
 
-    resp = requests.get(url, params)
-    if resp.status_code == 200:
-        cards = resp.json().get("cards", [])
+    try:
+        status, body = await get_with_retry(url, params=params)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        return f"{_SEARCH_ERROR}{e!r}"
+
+    if status == 200:
+        cards = orjson.loads(body).get("cards", [])
         if not cards:
             return f"No cards found matching '{query}'."
 
@@ -73,43 +150,151 @@ def search_trello_tool(query: str) -> str:
                 f"CARD_ID: {c['id']} | TITLE: {c['name']} | DESC: {c['desc'][:50]}"
             )
         return "\n".join(summary)
-    return f"Error searching Trello: {resp.text}"
+    return f"{_SEARCH_ERROR}{body.decode()}"
+
 
+async def prefetch_search(query: str) -> Optional[str]:
+    """Best-effort search for the executor prompt; None if the search failed."""
+    try:
+        result = await search_trello_tool(extract_keywords(query))
+    except Exception as e:
+        print(f"   Search prefetch failed: {e}")
+        return None
+
+    if result.startswith(_SEARCH_ERROR):
+        print(f"   Search prefetch failed: {result}")
+        return None
+    return result
+
+
+PLANNER_SYSTEM_PROMPT = (
+    "You are a Project Manager. "
+    "1. ALWAYS search Trello first. Use simple keywords (e.g., 'login' instead of 'fix login bug'). "
+    "2. If a card is found, your plan MUST be: 'Update card [INSERT_EXACT_ID_HERE]'. "
+    "   Example: 'Update card 60d5ec...' "
+    "3. If no card is found, your plan is to 'Create a new card'. "
+    "4. Include all details (assignee, priority) in the plan steps."
+)
 
 planner_agent = Agent(
     "google-gla:gemini-2.5-flash-lite",
     output_type=Plan,
     tools=[search_trello_tool],
-    system_prompt=(
-        "You are a Project Manager. "
-        "1. ALWAYS search Trello first. Use simple keywords (e.g., 'login' instead of 'fix login bug'). "
-        "2. If a card is found, your plan MUST be: 'Update card [INSERT_EXACT_ID_HERE]'. "
-        "   Example: 'Update card 60d5ec...' "
-        "3. If no card is found, your plan is to 'Create a new card'. "
-        "4. Include all details (assignee, priority) in the plan steps."
-    ),
+    system_prompt=PLANNER_SYSTEM_PROMPT,
+)
+
+
+EXECUTOR_SYSTEM_PROMPT = (
+    "You are a Task Drafter. "
+    "Rules:"
+    "1. If the plan mentions a specific Card ID (alphanumeric like 60d5...), put it in the 'id' field."
+    "2. NEVER put a person's name (like 'Shelley') in the 'id' field."
+    "3. If the plan says 'Create new', leave 'id' as None."
+    "4. Put assignee names and priority levels in the 'description' field."
 )
 
 
+def _executor_model():
+    if EXECUTOR_MODEL.startswith("ollama:"):
+        return OpenAIChatModel(
+            EXECUTOR_MODEL.removeprefix("ollama:"),
+            provider=OllamaProvider(base_url=OLLAMA_BASE_URL),
+        )
+    return EXECUTOR_MODEL
+
+
+async def check_executor_backend():
+    """Fails fast if the local Ollama executor is unreachable or not pulled."""
+    if not EXECUTOR_MODEL.startswith("ollama:"):
+        return
+
+    model_name = EXECUTOR_MODEL.removeprefix("ollama:")
+    models_url = f"{OLLAMA_BASE_URL.rstrip('/')}/models"
+    session = await get_session()
+    try:
+        async with session.get(
+            models_url, timeout=aiohttp.ClientTimeout(total=3)
+        ) as resp:
+            body = await resp.read()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise RuntimeError(
+            f"❌ Cannot reach Ollama at {OLLAMA_BASE_URL} ({e!r}). "
+            "Start it with `ollama serve`, or set EXECUTOR_MODEL to another model."
+        ) from e
+
+    hint = "Check that OLLAMA_BASE_URL points at Ollama's OpenAI-compatible /v1 API."
+    if resp.status != 200:
+        raise RuntimeError(
+            f"❌ Ollama returned {resp.status} for {models_url}. {hint}"
+        )
+    try:
+        models = {m["id"] for m in orjson.loads(body)["data"]}
+    except (orjson.JSONDecodeError, KeyError, TypeError) as e:
+        raise RuntimeError(
+            f"❌ Unexpected reply from {models_url} ({e!r}). {hint}"
+        ) from e
+
+    if model_name not in models:
+        raise RuntimeError(
+            f"❌ Ollama model '{model_name}' is not pulled. "
+            f"Run `ollama pull {model_name}`, or set EXECUTOR_MODEL to another model."
+        )
+
+
 executor_agent = Agent(
-    "google-gla:gemini-2.5-flash-lite",
+    _executor_model(),
     output_type=TrelloCard,
-    system_prompt=(
-        "You are a Task Drafter. "
-        "Rules:"
-        "1. If the plan mentions a specific Card ID (alphanumeric like 60d5...), put it in the 'id' field."
-        "2. NEVER put a person's name (like 'Shelley') in the 'id' field."
-        "3. If the plan says 'Create new', leave 'id' as None."
-        "4. Put assignee names and priority levels in the 'description' field."
-    ),
+    system_prompt=EXECUTOR_SYSTEM_PROMPT,
+)
+
+
+_PROMPT_HEAD = Template(
+    'Create a Trello Card for this request: "$q"\n'
+    "Follow this plan: $steps\n"
+    "Context: $reasoning\n"
+)
+
+_PROMPT_SEARCH = Template("\nExisting Trello cards that may match:\n$cards\n")
+
+_PROMPT_RETRY = Template(
+    "\n!!! PREVIOUS ATTEMPTS FAILED !!!\n"
+    "The Evaluator rejected your previous work with this feedback:\n"
+    "$fb\n\n"
+    "STRICT INSTRUCTION: You must fix these issues in your new draft.\n"
 )
 
 
+@lru_cache(maxsize=128)
+def _plan_section(query: str, steps: Tuple[str, ...], reasoning: str) -> str:
+    return _PROMPT_HEAD.substitute(q=query, steps=list(steps), reasoning=reasoning)
+
+
+_CARD_ID_RE = re.compile(r"CARD_ID: (\S+)")
+
+
+def draft_cache_key(state: AgentState) -> Optional[str]:
+    """Cache key for the approved draft of this request, or None if uncacheable.
+
+    Keyed on the normalized query plus the IDs of the cards the search found,
+    not on the executor prompt: the planner words its plan differently on
+    every run, so a prompt key would almost never hit. Without search results
+    we can't tell which card the draft targets, so nothing is cached.
+    """
+    if state.search_context is None:
+        return None
+
+    model = executor_agent.model
+    if not isinstance(model, str):
+        model = f"{model.system}:{model.model_name}"
+    card_ids = sorted(_CARD_ID_RE.findall(state.search_context))
+    key_input = f"{' '.join(_words(state.input_query))}\ncards: {card_ids}"
+    return LLMCache.make_key(model, EXECUTOR_SYSTEM_PROMPT, key_input)
+
+
 async def run_planner(state: AgentState) -> Plan:
     print(f"--- [Planner] Thinking about: {state.input_query} ---")
 
     result = await planner_agent.run(state.input_query)
-
     plan = result.output
 
     print(f"    > Reasoning: {plan.reasoning}")
@@ -121,20 +306,17 @@ async def run_planner(state: AgentState) -> Plan:
 async def run_executor(state: AgentState, current_plan: Plan) -> ExecutionResult:
     print(f"--- [Executor] Drafting Card... (Attempt {state.retry_count + 1}) ---")
 
-    prompt = f"""
-    Create a Trello Card for this request: "{state.input_query}"
-    Follow this plan: {current_plan.steps}
-    Context: {current_plan.reasoning}
-    """
+    prompt = _plan_section(
+        state.input_query, tuple(current_plan.steps), current_plan.reasoning
+    )
 
-    if state.scratchpad:
-        prompt += f"""
-        !!! PREVIOUS ATTEMPTS FAILED !!!
-        The Evaluator rejected your previous work with this feedback:
-        {json.dumps(state.scratchpad, indent=2)}
+    if state.search_context:
+        prompt += _PROMPT_SEARCH.substitute(cards=state.search_context)
 
-        STRICT INSTRUCTION: You must fix these issues in your new draft.
-        """
+    if state.scratchpad:
+        # Only the latest critique; the plan section above stays byte-identical
+        # across retries so it can be served from the provider's prefix cache.
+        prompt += _PROMPT_RETRY.substitute(fb=state.scratchpad[-1])
 
     try:
         result = await executor_agent.run(prompt)
@@ -144,6 +326,9 @@ async def run_executor(state: AgentState, current_plan: Plan) -> ExecutionResult
         return ExecutionResult(success=False, error_message=str(e))
 
 
+_ID_RE = re.compile(r"[a-f0-9]{10,}")
+
+
 async def run_evaluator(state: AgentState) -> Evaluation:
     print("--- [Evaluator] Checking Draft... ---")
 
@@ -153,7 +338,7 @@ async def run_evaluator(state: AgentState) -> Evaluation:
         return Evaluation(decision="reject", critique="No card was generated.")
 
     if draft.id:
-        if len(draft.id) < 10 or " " in draft.id:
+        if not _ID_RE.fullmatch(draft.id):
             return Evaluation(
                 decision="reject",
                 critique=f"The ID '{draft.id}' is invalid. It looks like a name or title. "
@@ -170,22 +355,17 @@ async def run_committer(state: AgentState):
     if not card:
         return "Error: No card to commit"
 
-    base_params = {
-        "key": os.getenv("TRELLO_API_KEY"),
-        "token": os.getenv("TRELLO_TOKEN"),
-    }
-
     # LOGIC BRANCH: UPDATE vs CREATE
     if card.id:
         # --- UPDATE EXISTING CARD ---
         print(f"   Action: Updating Card {card.id}")
         url = f"https://api.trello.com/1/cards/{card.id}"
         query = {
-            **base_params,
-            "name": f"[{card.tag}] {card.title}",
+            **_BASE_PARAMS,
+            "name": _TAG_PREFIX[card.tag] + card.title,
             "desc": card.description,
         }
-        response = requests.put(url, params=query)  # PUT
+        method = "PUT"
         action_type = "Updated"
 
     else:
@@ -193,80 +373,109 @@ async def run_committer(state: AgentState):
         print("   Action: Creating New Card")
         url = "https://api.trello.com/1/cards"
         query = {
-            **base_params,
-            "idList": os.getenv("TRELLO_LIST_ID"),
-            "name": f"[{card.tag}] {card.title}",
+            **_BASE_PARAMS,
+            "idList": _TRELLO_LIST_ID,
+            "name": _TAG_PREFIX[card.tag] + card.title,
             "desc": card.description,
             "pos": "top",
         }
-        response = requests.post(url, params=query)  # POST
+        method = "POST"
         action_type = "Created"
 
-    if response.status_code == 200:
-        return f"SUCCESS: {action_type} card {response.json().get('shortUrl')}"
+    session = await get_session()
+    async with session.request(method, url, params=query) as response:
+        body = await response.read()
+
+    if response.status == 200:
+        short_url = orjson.loads(body).get("shortUrl")
+        return f"SUCCESS: {action_type} card {short_url}"
     else:
-        return f"API ERROR: {response.text}"
+        return f"API ERROR: {body.decode()}"
 
 
-async def run_workflow(user_query: str):
+async def run_workflow(user_query: str) -> AgentState:
     state = AgentState(input_query=user_query)
-    current_plan = None
 
     print(f"Starting Workflow: {user_query}")
 
-    while state.current_step not in ["done", "failed"]:
-        if state.current_step == "planning":
-            current_plan = await run_planner(state)
-            state.current_step = "executing"
-
-        elif state.current_step == "executing":
-            if not current_plan:
-                raise ValueError("No Plan!")
-
-            exec_result = await run_executor(state, current_plan)
-
-            if exec_result.success:
-                state.draft_card = exec_result.output_data
-                state.current_step = "evaluating"
-            else:
-                state.retry_count += 1
-                print(f"Executor Crashed: {exec_result.error_message}")
-                if state.retry_count > state.max_retries:
-                    state.current_step = "failed"
-
-        elif state.current_step == "evaluating":
-            evaluation = await run_evaluator(state)
-
-            if evaluation.decision == "approve":
-                print(">>> Evaluator Approved. Moving to Commit.")
-                state.current_step = "committing"
-            else:
-                state.retry_count += 1
-                print(f">>> Evaluator Rejected: {evaluation.critique}")
-                if evaluation.critique is None:
-                    print("No critique provided")
-                else:
-                    state.scratchpad.append(evaluation.critique)
-
-                if state.retry_count > state.max_retries:
-                    print("!!! MAX RETRIES REACHED !!!")
-                    state.current_step = "failed"
-                    state.final_result = "Human Handoff Required"
-                else:
-                    state.current_step = "executing"
-
-        elif state.current_step == "committing":
-            result_msg = await run_committer(state)
-            state.final_result = result_msg
+    # Prefetch the Trello search while the planner is still thinking
+    planner_task = asyncio.create_task(run_planner(state))
+    state.search_context = await prefetch_search(user_query)
+
+    # A previously approved draft for the same request and matching cards
+    # makes both the plan and the executor run unnecessary.
+    cache_key = draft_cache_key(state)
+    cached = await _LLM_CACHE.get(cache_key) if cache_key else None
+    if cached is not None:
+        planner_task.cancel()
+        print(">>> Cache hit: reusing a previously approved draft.")
+        state.draft_card = TrelloCard.model_validate_json(cached)
+        state.final_result = await run_committer(state)
+        state.current_step = "done"
+        return state
+
+    current_plan = await planner_task
+
+    for attempt in range(state.max_retries + 1):
+        state.retry_count = attempt
+        exec_result = await run_executor(state, current_plan)
+        if not exec_result.success:
+            print(f"Executor Crashed: {exec_result.error_message}")
+            continue
+
+        state.draft_card = exec_result.output_data
+        evaluation = await run_evaluator(state)
+
+        if evaluation.decision == "approve":
+            print(">>> Evaluator Approved. Moving to Commit.")
+            if cache_key:
+                await _LLM_CACHE.set(cache_key, state.draft_card.model_dump_json())
+            state.final_result = await run_committer(state)
             state.current_step = "done"
+            return state
+
+        print(f">>> Evaluator Rejected: {evaluation.critique}")
+        if evaluation.critique is None:
+            print("No critique provided")
+        else:
+            state.scratchpad.append(evaluation.critique)
 
+    print("!!! MAX RETRIES REACHED !!!")
+    state.current_step = "failed"
+    state.final_result = "Human Handoff Required"
     return state
 
 
+async def _run_isolated(user_query: str) -> AgentState:
+    try:
+        return await run_workflow(user_query)
+    except Exception as e:
+        print(f"!!! Workflow crashed for '{user_query}': {e!r}")
+        return AgentState(
+            input_query=user_query,
+            current_step="failed",
+            final_result=f"Workflow error: {e!r}",
+        )
+
+
+async def run_workflow_batch(queries: List[str]) -> List[AgentState]:
+    """Runs one workflow per query concurrently so their API calls overlap.
+
+    Returns one state per query, in order. A query that raises (e.g. a Gemini
+    503 in its planner) comes back as a 'failed' state with the error in
+    final_result; the other queries still finish and report their results.
+    """
+    return await asyncio.gather(*(_run_isolated(q) for q in queries))
+
+
 async def main():
-    final_state = await run_workflow("Update the login bug.")
-    print(f"\nFINAL RESULT: {final_state.final_result}")
+    try:
+        await check_executor_backend()
+        final_state = await run_workflow("Update the login bug.")
+        print(f"\nFINAL RESULT: {final_state.final_result}")
+    finally:
+        await close_session()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(main(), loop_factory=uvloop.new_event_loop if uvloop else None)